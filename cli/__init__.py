@@ -1,4 +1,12 @@
 # -*- coding: utf-8 -*-
 
-# import parser
-from .parser import parser
+# export parser, built on first access
+def __getattr__(name: str):
+    if name == 'parser':
+        from .parser import parser
+
+        # rebind over the `cli.parser` submodule attribute
+        globals()['parser'] = parser
+        return parser
+    
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
@@ -2,12 +2,48 @@
 
 # import argparse
 from argparse import (
-	ArgumentParser, SUPPRESS
+	ArgumentParser, ArgumentTypeError, SUPPRESS
 )
 
 # import argparse formatter
 from utils.argparse_formatter import CustomHelpFormatter
 
+# TOML loader
+from utils.toml_cache import read_toml
+
+# validate prompt template
+def prompt_template(path: str) -> str:
+    '''
+    Validate a TOML prompt template path.
+
+    The template is parsed once here and cached for later use by the
+    blueprint runner.
+
+    :param path: The path to the TOML prompt template.
+    :type path: str
+
+    :return: The validated path.
+    :rtype: str
+
+    :raises ArgumentTypeError: If the file cannot be read or parsed, or if
+        it is missing the `[system]` or `[message]` prompts.
+    '''
+    try:
+        prompts = read_toml(path)
+    except Exception as e:
+        raise ArgumentTypeError(
+            f'cannot load prompt template {path}: {e}'
+        )
+    
+    for section in ['system', 'message']:
+        if not isinstance(prompts.get(section), dict) or \
+                'prompt' not in prompts[section]:
+            raise ArgumentTypeError(
+                f"prompt template {path} is missing '[{section}]' prompt"
+            )
+    
+    return path
+
 # create blueprint parser
 def create_blueprint_parser(parser: ArgumentParser) -> ArgumentParser:
     '''
@@ -34,7 +70,7 @@ def create_blueprint_parser(parser: ArgumentParser) -> ArgumentParser:
 
     blueprint_arguments.add_argument(
         '--prompt-template',
-        type=str,
+        type=prompt_template,
         required=True,
         metavar='',
         help=(
@@ -65,6 +101,24 @@ def create_blueprint_parser(parser: ArgumentParser) -> ArgumentParser:
         help='Number of narratives to process for blueprint generation'
     )
 
+    blueprint_arguments.add_argument(
+        '--batch',
+        action='store_true',
+        help=(
+            'Process narratives through the OpenAI Batch API. Results are '
+            'returned within 24 hours at a lower cost and without rate limits'
+        )
+    )
+
+    blueprint_arguments.add_argument(
+        '--structured-output',
+        action='store_true',
+        help=(
+            'Constrain responses to the strict JSON schema of the templates in '
+            '`prompt_examples/`. Only use with templates that request that output'
+        )
+    )
+
     # blueprint MongoDB arguments
     blueprint_mongodb_arguments = parser.add_argument_group(
         'Blueprint MongoDB arguments'
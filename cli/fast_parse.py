@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+
+'''
+Defines a fast parser for the fixed blueprint command line
+
+The schema mirrors `cli/blueprint_parser.py`. Any input outside of it
+(help, unknown or abbreviated options, missing or invalid values) is left
+to argparse, which owns usage and error reporting.
+
+'''
+
+# import blueprint argument types
+from cli.blueprint_parser import prompt_template
+
+# option -> (destination, type, required, default); bool options are flags
+BLUEPRINT_OPTIONS = {
+    '--model': ('model', str, False, 'gpt-4o-mini'),
+    '--prompt-template': ('prompt_template', prompt_template, True, None),
+    '--narrative-path': ('narrative_path', str, True, None),
+    '--sample-size': ('sample_size', int, False, None),
+    '--batch': ('batch', bool, False, False),
+    '--structured-output': ('structured_output', bool, False, False),
+    '--mongo-db-name': ('mongo_db_name', str, True, 'narrative-blueprint'),
+    '--mongo-collection-name': ('mongo_collection_name', str, True, None),
+}
+
+# fast parse
+def fast_parse(argv: list) -> dict:
+    '''
+    Parse blueprint arguments without building an argparse parser.
+
+    :param argv: The command line arguments, without the program name.
+    :type argv: list
+
+    :return: The parsed arguments, with the same keys as
+        `vars(parser.parse_args())`, or None if argparse should handle
+        the command line instead.
+    :rtype: dict
+    '''
+    values = {}
+    i = 0
+    while i < len(argv):
+        option, sep, value = argv[i].partition('=')
+        if option not in BLUEPRINT_OPTIONS:
+            return None
+        
+        if BLUEPRINT_OPTIONS[option][1] is bool:
+            # flags take no value
+            if sep:
+                return None
+            
+            value = True
+        elif not sep:
+            # value is the next argument
+            i += 1
+            if i >= len(argv) or argv[i].startswith('-'):
+                return None
+            
+            value = argv[i]
+        
+        values[option] = value
+        i += 1
+
+    # validate and convert
+    args = {}
+    for option, (dest, type_, required, default) in BLUEPRINT_OPTIONS.items():
+        if option not in values:
+            if required:
+                return None
+            
+            args[dest] = default
+            continue
+
+        try:
+            args[dest] = type_(values[option])
+        except Exception:
+            return None
+    
+    return args
@@ -38,5 +38,14 @@ def create_main_parser():
 
     return parser
 
-# create and export parser
-parser = create_main_parser()
+# create and export parser on first access
+def __getattr__(name: str):
+    '''
+    Build the main parser lazily (PEP 562).
+    '''
+    if name == 'parser':
+        parser = create_main_parser()
+        globals()['parser'] = parser
+        return parser
+    
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
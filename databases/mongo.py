@@ -3,21 +3,127 @@
 # import base class
 from .database import Database
 
-# MongoDB dependencies
-from pymongo import MongoClient
-from pymongo.collection import Collection
+# import modules
+import time
+import threading
+from itertools import chain
+from importlib.util import find_spec
+
+# typing
+from typing import TYPE_CHECKING
+
+# MongoDB dependencies, imported on first use
+if TYPE_CHECKING:
+    from pymongo.collection import Collection
+    from pymongo.cursor import Cursor
+    from pymongo import MongoClient
+
+# wire compressors, in order of preference
+def _available_compressors() -> str:
+    '''
+    Get the wire protocol compressors available in this environment.
+
+    zstd and snappy need the optional `zstandard` and `python-snappy`
+    packages. zlib is not used: its CPU cost in the writer thread is not
+    repaid on a local connection.
+
+    :return: A comma separated list of compressors, empty if none is
+        installed.
+    :rtype: str
+    '''
+    compressors = []
+    if find_spec('zstandard') is not None:
+        compressors.append('zstd')
+    if find_spec('snappy') is not None:
+        compressors.append('snappy')
+
+    return ','.join(compressors)
+
+# MongoDB clients, shared by all managers using the same connection string
+_clients = {}
+_clients_lock = threading.Lock()
+
+def _get_client(connection_string: str, max_pool_size: int) -> 'MongoClient':
+    '''
+    Get the shared MongoDB client for a connection string.
+
+    MongoClient is thread-safe and holds its own connection pool, so a
+    single client per connection string is created and reused.
+
+    :param connection_string: The MongoDB connection string.
+    :type connection_string: str
+
+    :param max_pool_size: Connection pool size, used for a new client.
+    :type max_pool_size: int
+
+    :return: The MongoDB client.
+    :rtype: pymongo.MongoClient
+    '''
+    with _clients_lock:
+        client = _clients.get(connection_string)
+        if client is None:
+            from pymongo import MongoClient
+
+            # compress only with the fast compressors, when installed
+            options = {}
+            compressors = _available_compressors()
+            if compressors:
+                options['compressors'] = compressors
+
+            client = MongoClient(
+                connection_string,
+                maxPoolSize=max_pool_size,
+                w=1,
+                **options
+            )
+            _clients[connection_string] = client
+
+    return client
 
 # MongoDBManager class
 class MongoDBManager(Database):
     '''
     MongoDBManager class to manage MongoDB connections and operations.
     '''
+
+    # number of documents sent per insert_many call
+    BATCH_SIZE = 1000
+
+    # connection pool size, twice LanguageModel.MAX_CONCURRENT_REQUESTS
+    MAX_POOL_SIZE = 20
+
+    # documents buffered per producer thread before handing them to the
+    # background writer
+    LOCAL_BATCH_SIZE = 32
+
+    # maximum seconds a producer keeps documents buffered, and between
+    # background writer checks for handed buffers
+    WRITE_BATCH_WAIT = 1.0
+
     def __init__(self):
         '''
         Initializes the MongoDBManager instance.
         '''
         connection_string = 'mongodb://localhost:27017/'
-        self.client = MongoClient(connection_string)
+        self.client = _get_client(connection_string, self.MAX_POOL_SIZE)
+
+        # cached collection handles keyed by (db_name, collection_name)
+        self._collections = {}
+
+        # per-thread write buffers, as [buffer, thread, last handoff] holders
+        self._local = threading.local()
+        self._holders = []
+
+        # full buffers handed to the background writer
+        self._buffers_lock = threading.Lock()
+        self._completed_buffers = []
+        self._buffers_ready = threading.Event()
+
+        # background writer, started on first enqueue_insert
+        self._writer = None
+        self._writer_lock = threading.Lock()
+        self._writer_stop = threading.Event()
+        self._write_errors = []
 
     def test_access_to_db_and_collection(self,
                                          db_name: str,
@@ -36,14 +142,13 @@ class MongoDBManager(Database):
         '''
         db = self.client[db_name]
 
-        # list all collections
-        collections = db.list_collection_names()
-        if collection_name in collections:
-            return True
-        else:
-            return False
+        # list only the requested collection
+        collections = db.list_collection_names(
+            filter={'name': collection_name}
+        )
+        return bool(collections)
 
-    def get_collection(self, db_name: str, collection_name: str) -> Collection:
+    def get_collection(self, db_name: str, collection_name: str) -> 'Collection':
         '''
         Retrieves a collection from the MongoDB database.
 
@@ -56,17 +161,46 @@ class MongoDBManager(Database):
         :return: The collection object.
         :rtype: pymongo.collection.Collection
         '''
-        db = self.client[db_name]
+        key = (db_name, collection_name)
+        collection = self._collections.get(key)
+        if collection is None:
+            # access to db collection
+            collection = self.client[db_name][collection_name]
+            self._collections[key] = collection
 
-        # access to db collection
-        collection = db[collection_name]
         return collection
     
+    def ensure_indexes(self, db_name: str, collection_name: str) -> None:
+        '''
+        Ensures the MongoDB collection has an index on `uuid`.
+
+        A unique index is preferred. If the collection already holds
+        duplicated UUIDs, a non-unique index is created instead.
+
+        :param db_name: The name of the MongoDB database.
+        :type db_name: str
+
+        :param collection_name: The name of the MongoDB collection.
+        :type collection_name: str
+        '''
+        from pymongo.errors import OperationFailure
+
+        collection = self.get_collection(db_name, collection_name)
+
+        try:
+            collection.create_index('uuid', unique=True, background=True)
+        except OperationFailure:
+            # existing duplicates prevent a unique index
+            collection.create_index('uuid', background=True)
+
     def get_collected_uuids(self,
                             db_name: str,
                             collection_name: str) -> list:
         '''
-        Retrieves all UUIDs from the MongoDB collection.
+        Retrieves all distinct UUIDs from the MongoDB collection.
+
+        UUIDs are grouped server side and read through a cursor, so the
+        result is not bound by the 16 MB document limit of `distinct`.
 
         :param db_name: The name of the MongoDB database.
         :type db_name: str
@@ -77,23 +211,25 @@ class MongoDBManager(Database):
         :return: A list of UUIDs.
         :rtype: list
         '''
-        db = self.client[db_name]
-        collection = db[collection_name]
-        uuids = [
-            doc['uuid'] for doc in collection.find(
-                {}, {'uuid': 1, '_id': 0}
-            )
-        ]
-        
-        return uuids
+        collection = self.get_collection(db_name, collection_name)
+        cursor = collection.aggregate(
+            [{'$group': {'_id': '$uuid'}}],
+            allowDiskUse=True,
+            batchSize=self.BATCH_SIZE
+        )
+        return [doc['_id'] for doc in cursor]
 
     def insert_many(self,
                     data: list,
                     db_name: str,
-                    collection_name: str) -> None:
+                    collection_name: str,
+                    batch_size: int = None) -> None:
         '''
         Inserts a list of data into the MongoDB collection.
 
+        Data is sent in unordered batches, so a failing document does not
+        prevent the remaining documents of the batch from being inserted.
+
         :param data: The data to be inserted.
         :type data: list
 
@@ -102,11 +238,207 @@ class MongoDBManager(Database):
 
         :param collection_name: The name of the MongoDB collection.
         :type collection_name: str
+
+        :param batch_size: Number of documents per batch (optional).
+            Defaults to `BATCH_SIZE`.
+        :type batch_size: int, optional
         '''
-        db = self.client[db_name]
-        collection = db[collection_name]
-        collection.insert_many(data)
+        batch_size = batch_size or self.BATCH_SIZE
+
+        collection = self.get_collection(db_name, collection_name)
+        for i in range(0, len(data), batch_size):
+            collection.insert_many(
+                data[i:i + batch_size],
+                ordered=False
+            )
+    
+    def bulk_upsert(self,
+                    data: list,
+                    db_name: str,
+                    collection_name: str,
+                    batch_size: int = None) -> None:
+        '''
+        Upserts a list of data into the MongoDB collection keyed on `uuid`.
+
+        Documents whose `uuid` is already stored are left untouched, which
+        makes re-running an analysis over the same narratives idempotent.
+
+        :param data: The data to be upserted. Each item must have a `uuid`.
+        :type data: list
+
+        :param db_name: The name of the MongoDB database.
+        :type db_name: str
+
+        :param collection_name: The name of the MongoDB collection.
+        :type collection_name: str
+
+        :param batch_size: Number of operations per batch (optional).
+            Defaults to `BATCH_SIZE`.
+        :type batch_size: int, optional
+        '''
+        from pymongo import UpdateOne
+
+        batch_size = batch_size or self.BATCH_SIZE
+
+        collection = self.get_collection(db_name, collection_name)
+        for i in range(0, len(data), batch_size):
+            operations = [
+                UpdateOne(
+                    {'uuid': doc['uuid']},
+                    {'$setOnInsert': doc},
+                    upsert=True
+                )
+                for doc in data[i:i + batch_size]
+            ]
+            collection.bulk_write(operations, ordered=False)
     
+    def enqueue_insert(self,
+                       data: list,
+                       db_name: str,
+                       collection_name: str) -> None:
+        '''
+        Queues a list of data to be stored by the background writer.
+
+        Data is buffered per calling thread and handed to the writer, with
+        a single lock acquisition, once `LOCAL_BATCH_SIZE` documents are
+        buffered or `WRITE_BATCH_WAIT` seconds have passed since the last
+        handoff. It is upserted with `bulk_upsert`. Call `flush` to store
+        all queued data, including partially filled buffers.
+
+        :param data: The data to be stored. Each item must have a `uuid`.
+        :type data: list
+
+        :param db_name: The name of the MongoDB database.
+        :type db_name: str
+
+        :param collection_name: The name of the MongoDB collection.
+        :type collection_name: str
+        '''
+        with self._writer_lock:
+            if self._writer is None:
+                self._writer = threading.Thread(
+                    target=self._writer_loop,
+                    name='mongo-writer',
+                    daemon=True
+                )
+                self._writer.start()
+        
+        holder = getattr(self._local, 'holder', None)
+        if holder is None:
+            holder = [[], threading.current_thread(), time.monotonic()]
+            self._local.holder = holder
+            with self._buffers_lock:
+                self._holders.append(holder)
+        
+        buffer = holder[0]
+        buffer.extend(
+            (db_name, collection_name, doc) for doc in data
+        )
+        now = time.monotonic()
+        if (len(buffer) >= self.LOCAL_BATCH_SIZE
+                or now - holder[2] >= self.WRITE_BATCH_WAIT):
+            # swap the full or stale buffer for an empty one
+            with self._buffers_lock:
+                self._completed_buffers.append(buffer)
+                holder[0] = []
+            
+            holder[2] = now
+            self._buffers_ready.set()
+
+    def _writer_loop(self) -> None:
+        '''
+        Store handed buffers until `flush` stops the writer.
+
+        Buffers are taken all at once, grouped by database and collection
+        and written with one bulk call per group. Errors are kept and
+        returned by `flush`.
+        '''
+        while True:
+            self._buffers_ready.wait(self.WRITE_BATCH_WAIT)
+            self._buffers_ready.clear()
+            stopping = self._writer_stop.is_set()
+
+            # take all handed buffers
+            with self._buffers_lock:
+                pending, self._completed_buffers = self._completed_buffers, []
+            
+            # group by database and collection
+            batches = {}
+            for db_name, collection_name, doc in chain.from_iterable(pending):
+                batches.setdefault((db_name, collection_name), []).append(doc)
+            
+            # write batches
+            for (db_name, collection_name), data in batches.items():
+                try:
+                    self.bulk_upsert(data, db_name, collection_name)
+                except Exception as e:
+                    self._write_errors.append(e)
+            
+            if stopping:
+                return
+
+    def flush(self) -> list:
+        '''
+        Store all queued data and stop the background writer.
+
+        Must be called once the threads queuing data are done, since their
+        partially filled buffers are handed to the writer here.
+
+        :return: The errors raised while writing since the last flush.
+        :rtype: list
+        '''
+        with self._writer_lock:
+            with self._buffers_lock:
+                # hand partially filled buffers to the writer
+                for holder in self._holders:
+                    if holder[0]:
+                        self._completed_buffers.append(holder[0])
+                        holder[0] = []
+                
+                # forget buffers of finished threads
+                self._holders = [
+                    holder for holder in self._holders if holder[1].is_alive()
+                ]
+            
+            if self._writer is not None:
+                self._writer_stop.set()
+                self._buffers_ready.set()
+                self._writer.join()
+                self._writer = None
+                self._writer_stop.clear()
+        
+            errors, self._write_errors = self._write_errors, []
+        
+        return errors
+
+    def iter_documents(self,
+                       db_name: str,
+                       collection_name: str,
+                       batch_size: int = None) -> 'Cursor':
+        '''
+        Iterates over all documents from the MongoDB collection.
+
+        Documents are fetched from the server in batches, so only one batch
+        is held in memory at a time.
+
+        :param db_name: The name of the MongoDB database.
+        :type db_name: str
+
+        :param collection_name: The name of the MongoDB collection.
+        :type collection_name: str
+
+        :param batch_size: Number of documents per round trip (optional).
+            Defaults to `BATCH_SIZE`.
+        :type batch_size: int, optional
+
+        :return: A cursor over the documents.
+        :rtype: pymongo.cursor.Cursor
+        '''
+        batch_size = batch_size or self.BATCH_SIZE
+
+        collection = self.get_collection(db_name, collection_name)
+        return collection.find({}).batch_size(batch_size)
+
     def get_documents(self,
                       db_name: str,
                       collection_name: str) -> list:
@@ -122,9 +454,7 @@ class MongoDBManager(Database):
         :return: A list of documents.
         :rtype: list
         '''
-        db = self.client[db_name]
-        collection = db[collection_name]
-        return [doc for doc in collection.find({})]
+        return list(self.iter_documents(db_name, collection_name))
     
     def upload_test_case(self,
                          test_case: dict,
@@ -142,6 +472,5 @@ class MongoDBManager(Database):
         :param collection_name: The name of the MongoDB collection.
         :type collection_name: str
         '''
-        db = self.client[db_name]
-        collection = db[collection_name]
+        collection = self.get_collection(db_name, collection_name)
         collection.insert_one(test_case)
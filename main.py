@@ -1,34 +1,33 @@
 # -*- coding: utf-8 -*-
 
 # import modules
+import sys
 import time
 
 # import key arguments
-from cli import parser
-
-# import blueprint runner
-from runners.blueprint_runner import handle_blueprint
+from cli.fast_parse import fast_parse
 
 def main():
-    # parse arguments
-    args = vars(parser.parse_args())
+    # parse arguments; argparse handles help and invalid input
+    args = fast_parse(sys.argv[1:])
+    if args is None:
+        from cli import parser
+        args = vars(parser.parse_args())
 
-    # start process
-    log_text = f'''
-    > Starting program at: {time.ctime()}
+    # import blueprint runner once arguments are valid; this keeps --help
+    # and argument errors free of the model and database dependencies
+    from runners.blueprint_runner import handle_blueprint
 
-    '''
-    print ('\n\n' + ' '.join(log_text.split()).strip() + '\n\n')
+    # start process; ctime pads single-digit days with a second space
+    start_time = ' '.join(time.ctime().split())
+    print (f'\n\n> Starting program at: {start_time}\n\n')
 
     # process blueprint arguments directly
     handle_blueprint(args)
 
     # end process
-    log_text = f'''
-    > Ending program at: {time.ctime()}
-
-    '''
-    print ('\n\n' + ' '.join(log_text.split()).strip())
+    end_time = ' '.join(time.ctime().split())
+    print (f'\n\n> Ending program at: {end_time}')
 
 if __name__ == '__main__':
     main()
@@ -5,18 +5,108 @@ Defines LanguageModel base class
 
 '''
 
+from __future__ import annotations
+
 # import modules
 import os
 import time
-import json
+import queue
+import atexit
 import random
+import logging
 import threading
 
+# cache
+from functools import lru_cache
+
+# collections
+from collections import deque
+
 # abstract base class
 from abc import ABC, abstractmethod
 
-# tqdm bar
-from tqdm import tqdm
+# typing
+from typing import TYPE_CHECKING
+
+# JSON helpers
+from utils import json_io
+
+# queued logging
+from logging.handlers import QueueHandler, QueueListener
+
+# tqdm bar, only needed for annotations
+if TYPE_CHECKING:
+    from tqdm import tqdm
+
+# queue handler that leaves formatting to the listener thread
+class _DeferredQueueHandler(QueueHandler):
+    '''
+    Queue handler that enqueues log records unformatted.
+
+    The default handler formats the message and traceback in the logging
+    thread; here it happens on the listener thread instead.
+    '''
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        '''
+        Return the record unchanged.
+
+        :param record: The log record to be queued.
+        :type record: logging.LogRecord
+
+        :return: The same log record.
+        :rtype: logging.LogRecord
+        '''
+        return record
+
+# file loggers, one queue listener per log file
+@lru_cache(maxsize=None)
+def _get_file_logger(path: str) -> logging.Logger:
+    '''
+    Get a logger writing to a log file through a background listener.
+
+    The listener is stopped, and pending records written, at exit.
+
+    :param path: The absolute path to the log file.
+    :type path: str
+
+    :return: The logger for the log file.
+    :rtype: logging.Logger
+    '''
+    log_dir = os.path.dirname(path)
+    if log_dir:
+        os.makedirs(log_dir, exist_ok=True)
+
+    file_handler = logging.FileHandler(path, encoding='utf-8')
+    file_handler.setFormatter(logging.Formatter('%(message)s'))
+
+    log_queue = queue.SimpleQueue()
+    listener = QueueListener(log_queue, file_handler)
+    listener.start()
+    atexit.register(listener.stop)
+
+    # one logger per log file, named after its full path
+    logger = logging.getLogger(f'narrative_blueprint.log:{path}')
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    logger.addHandler(_DeferredQueueHandler(log_queue))
+
+    return logger
+
+# model limits, read once per process
+@lru_cache(maxsize=None)
+def _load_model_limits(path: str) -> dict:
+    '''
+    Load the model limits configuration file.
+
+    :param path: The path to the model limits JSON file.
+    :type path: str
+
+    :return: A dictionary containing model limits for different providers and models.
+    :rtype: dict
+    '''
+    with open(path, 'rb') as f:
+        return json_io.load(f)
 
 # LanguageModel abstract base class
 class LanguageModel(ABC):
@@ -31,17 +121,24 @@ class LanguageModel(ABC):
         - MAX_CONCURRENT_REQUESTS: Maximum number of concurrent requests allowed.
         - DEFAULT_JITTER: Default jitter value for rate limiting.
         - TEMPERATURE: Output parameter for controlling randomness in responses.
+        - TOKEN_CACHE_SIZE: Number of prompts with cached token estimates.
+        - WINDOW_SOFT_CAP_FACTOR: Token usage window size cap, as a multiple of requests per minute.
 
     Public Methods:
         - get_log_file: Abstract method to get the log file path.
         - _log_write: Write a message to the log file.
         - _update_tqdm_postfix: Update the tqdm progress bar postfix safely.
         - _update_tqdm_description: Update the tqdm progress bar description safely.
+        - _record_token_usage: Record the tokens used by a response.
+        - _pop_token_usage: Drop the oldest entry of the token usage window.
         - _get_average_completion_tokens: Get the average number of tokens used in responses.
         - _enforce_rate_limits: Enforce rate limits for API requests.
         - _signal_handler: Handle termination signals.
+        - estimate_tokens: Estimate tokens in a prompt, with caching.
         - _estimate_tokens: Abstract method to estimate tokens in a prompt.
+        - _estimate_tokens_batch: Estimate tokens in many prompts at once.
         - run_parallel_prompt_tasks: Abstract method to process multiple messages.
+        - run_batch_prompt_tasks: Process multiple messages through a batch API, if supported.
     '''
 
     # average token usage
@@ -56,6 +153,12 @@ class LanguageModel(ABC):
     # output parameters
     TEMPERATURE = 0.05
 
+    # number of prompts with cached token estimates
+    TOKEN_CACHE_SIZE = 1024
+
+    # token usage window entries kept, as a multiple of requests per minute
+    WINDOW_SOFT_CAP_FACTOR = 2
+
     def __init__(self, provider: str, model_name: str):
         '''
         Initialize the LanguageModel abstract base class.
@@ -76,17 +179,43 @@ class LanguageModel(ABC):
         # API limits
         self.request_interval = 60.0 / self.max_requests_per_min
 
+        # maximum entries kept in the token usage window; beyond it the
+        # oldest entries are dropped and accounting becomes approximate.
+        # The request window needs no cap: admission keeps it below rpm
+        self.window_soft_cap = self.WINDOW_SOFT_CAP_FACTOR * self.max_requests_per_min
+
         # shared threading locks
-        self.rate_limit_lock = threading.Lock()
         self.token_lock = threading.Lock()
         self.tqdm_lock = threading.Lock()
 
+        # log file logger, set up on first write
+        self._logger = None
+
+        # rate limit condition, notified when token usage is recorded;
+        # only threads held back by the token limit wait on it
+        self._cv = threading.Condition(self.token_lock)
+        self._tpm_waiters = 0
+
         # shared controls for rate limiting
-        self.request_timestamps = []
-        self.token_usage_log = []
+        self.request_timestamps = deque()
+
+        # token usage window, as parallel timestamp / prompt / completion deques
+        self.token_usage_times = deque()
+        self.token_usage_prompt = deque()
+        self.token_usage_completion = deque()
 
-        # threading semaphore
-        self.semaphore = threading.Semaphore(self.MAX_CONCURRENT_REQUESTS)
+        # running sums over the token usage window
+        self._token_sum = 0
+        self._completion_sum = 0
+        self._completion_count = 0
+
+        # cached token estimates, keyed by prompt
+        self._estimate_tokens_cached = lru_cache(
+            maxsize=self.TOKEN_CACHE_SIZE
+        )(self._estimate_tokens)
+
+        # bound random generator for jitter
+        self._rand = random.random
 
         # shared threading event
         self.stop_flag = threading.Event()
@@ -98,13 +227,10 @@ class LanguageModel(ABC):
         :return: A dictionary containing model limits for different providers and models.
         :rtype: dict
         :raises FileNotFoundError: If the model limits configuration file does not exist.
-        :raises json.JSONDecodeError: If the configuration file is not a valid JSON.
+        :raises ValueError: If the configuration file is not a valid JSON.
         '''
         path = './config/model_limits.json'
-        with open(path, 'r', encoding='utf-8') as f:
-            model_limits = json.load(f)
-        
-        return model_limits
+        return _load_model_limits(path)
     
     @abstractmethod
     def get_log_file(self) -> str:
@@ -116,31 +242,40 @@ class LanguageModel(ABC):
         '''
         pass
 
-    def _log_write(self, message: str) -> None:
+    def _log_write(self,
+                   message: str,
+                   *args,
+                   exc_info: bool = False) -> None:
         '''
         Write a message to the log file.
 
+        The message is queued and written by a background thread. `args` are
+        merged into the message with %-formatting on that thread, as is the
+        traceback of the exception being handled when `exc_info` is set.
+
         :param message: The message to be written to the log file.
         :type message: str
-        :raises IOError: If there is an error writing to the log file.
+
+        :param args: Arguments merged into the message (optional).
+        :type args: tuple, optional
+
+        :param exc_info: Append the current exception traceback (optional).
+        :type exc_info: bool, optional
         :return: None
         '''
-        # get log file
-        log_file = self.get_log_file()
-
-        # create log directory if it doesn't exist
-        log_dir = os.path.dirname(log_file)
-        if not os.path.exists(log_dir):
-            os.makedirs(log_dir)
+        logger = self._logger
+        if logger is None:
+            log_path = os.path.abspath(self.get_log_file())
+            logger = self._logger = _get_file_logger(log_path)
 
-        # write to log file
-        with open(log_file, 'a') as f:
-            f.write(message + '\n')
+        logger.info(message, *args, exc_info=exc_info)
     
     def _update_tqdm_postfix(self, pbar: tqdm, data: dict) -> None:
         '''
         Update the tqdm progress bar postfix (metrics) safely.
 
+        The bar is not redrawn; the change shows on its next refresh.
+
         :param pbar: The tqdm progress bar instance.
         :type pbar: tqdm
 
@@ -150,12 +285,15 @@ class LanguageModel(ABC):
         '''
         if pbar is not None:
             with self.tqdm_lock:
-                pbar.set_postfix(data)
+                pbar.set_postfix(data, refresh=False)
     
     def _update_tqdm_description(self, pbar: tqdm, message: str) -> None:
         '''
         Update the tqdm progress bar description safely.
 
+        Descriptions report rare state changes, such as rate limit waits or
+        failures, so the bar is redrawn right away.
+
         :param pbar: The tqdm progress bar instance.
         :type pbar: tqdm
 
@@ -167,6 +305,50 @@ class LanguageModel(ABC):
             with self.tqdm_lock:
                 pbar.set_description(f'{self.model_name} - {message}')
     
+    def _record_token_usage(self, prompt_tokens: int,
+                            completion_tokens: int) -> None:
+        '''
+        Record the tokens used by a response in the rate limit window.
+
+        :param prompt_tokens: The number of prompt tokens used.
+        :type prompt_tokens: int
+
+        :param completion_tokens: The number of completion tokens used.
+        :type completion_tokens: int
+        :return: None
+        '''
+        with self._cv:
+            self.token_usage_times.append(time.time())
+            self.token_usage_prompt.append(prompt_tokens)
+            self.token_usage_completion.append(completion_tokens)
+            self._token_sum += prompt_tokens + completion_tokens
+            self._completion_sum += completion_tokens
+            self._completion_count += 1
+
+            # bound the window size under extreme bursts
+            while len(self.token_usage_times) > self.window_soft_cap:
+                self._pop_token_usage()
+
+            # wake threads held back by the token limit to re-check the
+            # window; a new record never frees a request slot
+            if self._tpm_waiters:
+                self._cv.notify_all()
+
+    def _pop_token_usage(self) -> None:
+        '''
+        Drop the oldest entry of the token usage window.
+
+        Must be called with `token_lock` held.
+
+        :return: None
+        '''
+        self.token_usage_times.popleft()
+        p = self.token_usage_prompt.popleft()
+        c = self.token_usage_completion.popleft()
+        self._token_sum -= p + c
+        self._completion_sum -= c
+        self._completion_count -= 1
+
     def _get_average_completion_tokens(self) -> int:
         '''
         Get the average number of tokens used in responses.
@@ -174,11 +356,10 @@ class LanguageModel(ABC):
         :return: The average number of tokens used in responses.
         :rtype: int
         '''
-        if not self.token_usage_log:
+        if not self._completion_count:
             return self.AVERAGE_TOKEN_USAGE
         
-        completion_tokens = [c for _, _, c in self.token_usage_log]
-        return int(sum(completion_tokens) / len(completion_tokens))
+        return self._completion_sum // self._completion_count
     
     def _enforce_rate_limits(self, estimated_tokens: int,
                              pbar: tqdm = None) -> None:
@@ -186,7 +367,7 @@ class LanguageModel(ABC):
         Enforce rate limits for API requests.
 
         This method ensures that the number of requests and tokens used per minute does not exceed
-        the specified limits.
+        the specified limits. It returns without reserving a slot if the stop flag is set.
 
         :param estimated_tokens: The estimated tokens in the prompt.
         :type estimated_tokens: int
@@ -196,31 +377,30 @@ class LanguageModel(ABC):
         :return: None
         '''
         # wait for rate limit slot
-        while True:
-            wait_time = 0
-            with self.rate_limit_lock, self.token_lock:
+        while not self.stop_flag.is_set():
+            request_wait = 0
+            token_wait = 0
+            with self._cv:
                 now = time.time()
 
-                # timestamps and tokens used
-                self.request_timestamps[:] = [
-                    t for t in self.request_timestamps if now - t < 60.0
-                ]
-                self.token_usage_log[:] = [
-                    (t, p, c) for t, p, c in self.token_usage_log if now - t < 60.0
-                ]
+                # evict timestamps and tokens older than 60s
+                request_timestamps = self.request_timestamps
+                while request_timestamps and now - request_timestamps[0] >= 60.0:
+                    request_timestamps.popleft()
+
+                token_usage_times = self.token_usage_times
+                while token_usage_times and now - token_usage_times[0] >= 60.0:
+                    self._pop_token_usage()
 
                 if len(self.request_timestamps) >= self.max_requests_per_min:
                     if self.request_timestamps:
+                        # wait until the oldest request leaves the window
                         oldest_request_time = self.request_timestamps[0]
-                        request_wait = 60.0 - (now - oldest_request_time)
+                        request_wait = oldest_request_time + 60.0 - now
                     else:
                         request_wait = 1.0
-                    wait_time = max(wait_time, request_wait)
                 
-                tokens_used = sum(p + c for _, p, c in self.token_usage_log)
-
-                # update progress bar
-                self._update_tqdm_postfix(pbar, {'Tokens used/60s': tokens_used})
+                tokens_used = self._token_sum
 
                 # response buffer
                 response_buffer = self._get_average_completion_tokens()
@@ -228,31 +408,49 @@ class LanguageModel(ABC):
                 # aggregate tokens -> tokens already used + (estimated tokens in next prompt) + (avg tokens in responses)
                 agg_tokens = tokens_used + estimated_tokens + response_buffer
                 if agg_tokens > self.max_tokens_per_min:
-                    if self.token_usage_log:
-                        oldest_token_time = self.token_usage_log[0][0]
-                        token_wait = 60.0 - (now - oldest_token_time)
+                    if self.token_usage_times:
+                        # wait until the oldest usage leaves the window
+                        oldest_token_time = self.token_usage_times[0]
+                        token_wait = oldest_token_time + 60.0 - now
                     else:
                         token_wait = 1.0
-                    wait_time = max(wait_time, token_wait)
                 
+                wait_time = max(request_wait, token_wait)
                 if wait_time == 0:
                     # no enforced wait time
                     now = time.time()
                     self.request_timestamps.append(now)
 
-                    # add jitter to avoid thread pileup
-                    jitter = self.DEFAULT_JITTER + random.uniform(0, 0.05)
-                    self.stop_flag.wait(jitter)
-                    break
+            # update progress bar outside the rate limit locks
+            self._update_tqdm_postfix(pbar, {'Tokens used/60s': tokens_used})
+
+            if wait_time == 0:
+                # slot reserved; add jitter to avoid thread pileup, without
+                # holding the lock
+                jitter = self.DEFAULT_JITTER + self._rand() * 0.05
+                self.stop_flag.wait(jitter)
+                break
 
             # wait_time != 0 - enforced rate-limit sleep - when over RPM/TPM
-            jittered_wait = wait_time + random.uniform(0.05, 0.25)
+            jittered_wait = wait_time + 0.05 + self._rand() * 0.20
             self._update_tqdm_description(
                 pbar,
                 f'[WAITING] Sleeping {jittered_wait:.2f}s (RPM/TPM limit)'
             )
 
-            self.stop_flag.wait(jittered_wait)
+            if request_wait >= token_wait:
+                # held back by the request limit; sleep until the oldest
+                # request leaves the window or the process is stopped
+                self.stop_flag.wait(jittered_wait)
+            else:
+                # held back by the token limit; sleep until the window frees
+                # up, a response is recorded or the process is stopped
+                with self._cv:
+                    self._tpm_waiters += 1
+                    try:
+                        self._cv.wait(jittered_wait)
+                    finally:
+                        self._tpm_waiters -= 1
     
     def _signal_handler(self, sig, frame) -> None:
         '''
@@ -267,6 +465,36 @@ class LanguageModel(ABC):
         '''
         self.stop_flag.set()
 
+        # wake threads waiting on rate limits
+        with self._cv:
+            self._cv.notify_all()
+
+    def estimate_tokens(self, prompt: str) -> int:
+        '''
+        Estimate the number of tokens in the prompt.
+
+        Results are cached, so repeated prompts are only tokenized once.
+
+        :param prompt: The prompt to be estimated.
+        :type prompt: str
+        :return: The estimated number of tokens.
+        :rtype: int
+        '''
+        return self._estimate_tokens_cached(prompt)
+
+    def _estimate_tokens_batch(self, prompts: list) -> list:
+        '''
+        Estimate the number of tokens in many prompts at once.
+
+        Providers with a batch tokenizer should override this method.
+
+        :param prompts: The prompts to be estimated.
+        :type prompts: list
+        :return: The estimated number of tokens of each prompt.
+        :rtype: list
+        '''
+        return [self.estimate_tokens(prompt) for prompt in prompts]
+
     @abstractmethod
     def _estimate_tokens(self, prompt: str) -> int:
         '''
@@ -289,3 +517,16 @@ class LanguageModel(ABC):
         :return: None
         '''
         pass
+
+    def run_batch_prompt_tasks(self, messages: list) -> None:
+        '''
+        Process multiple messages through the provider's batch API.
+
+        :param messages: List of messages to be processed.
+        :type messages: list
+        :raises NotImplementedError: If the provider does not support batch processing.
+        :return: None
+        '''
+        raise NotImplementedError(
+            f'{self.__class__.__name__} does not support batch processing'
+        )
@@ -1,23 +1,29 @@
 # -*- coding: utf-8 -*-
 
 # import modules
+import os
 import ast
-import json
 import time
 import signal
 import random
+import threading
 import openai
 import tiktoken
-import traceback
 
 # typing
-from typing import Callable
+from typing import Callable, Iterator
+
+# iteration
+from itertools import chain
+
+# cache
+from functools import lru_cache
 
 # dotenv for environment variables
 from dotenv import load_dotenv
 
 # multithreading
-from concurrent.futures import ThreadPoolExecutor, wait
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 # tqdm bar
 from tqdm import tqdm
@@ -31,6 +37,37 @@ from openai import OpenAI, RateLimitError
 # MongoDB connection
 from databases import MongoDBManager
 
+# JSON helpers
+from utils import json_io
+
+# environment variables, loaded once per process
+@lru_cache(maxsize=None)
+def _load_env(path: str) -> None:
+    '''
+    Load environment variables from a dotenv file.
+
+    :param path: The path to the dotenv file.
+    :type path: str
+    '''
+    load_dotenv(path)
+
+# token encodings, shared by all instances
+@lru_cache(maxsize=None)
+def _get_encoding(model_name: str) -> tiktoken.Encoding:
+    '''
+    Get the token encoding for an OpenAI model.
+
+    :param model_name: The name of the OpenAI model.
+    :type model_name: str
+
+    :return: The model encoding, or `o200k_base` for unknown models.
+    :rtype: tiktoken.Encoding
+    '''
+    try:
+        return tiktoken.encoding_for_model(model_name)
+    except KeyError:
+        return tiktoken.get_encoding('o200k_base')
+
 # OpenAIGPT class
 class OpenAIGPT(LanguageModel):
     '''
@@ -42,9 +79,16 @@ class OpenAIGPT(LanguageModel):
     Public Methods:
         - get_log_file: Returns the path to the log file.
         - _estimate_tokens: Estimates the number of tokens in a given prompt.
+        - _estimate_tokens_batch: Estimates the number of tokens in many prompts at once.
         - _process_response: Processes the API response and logs it to MongoDB.
         - _call_with_backoff: Calls the OpenAI API with a backoff strategy for rate limits.
         - run_parallel_prompt_tasks: Executes multiple prompt tasks in parallel.
+        - run_batch_prompt_tasks: Executes multiple prompt tasks through the Batch API.
+        - _build_batch_files: Builds the Batch API input files.
+        - _create_batch: Uploads an input file and creates its batch.
+        - _poll_batches: Polls batches and stores their results.
+        - _refresh_batches: Retrieves pending batches and stores finished ones.
+        - _store_batch_results: Stores the results of a finished batch.
 
     Instance Variables:
         - client: OpenAI client instance.
@@ -54,6 +98,27 @@ class OpenAIGPT(LanguageModel):
         - audit_response: Instance for auditing responses.
         - mongodb_manager: MongoDB connection manager.
     '''
+
+    # prompts tokenized per encode_ordinary_batch call; bounds the token
+    # lists held in memory at once
+    TOKEN_BATCH_SIZE = 1024
+
+    # maximum number of requests per Batch API input file
+    BATCH_MAX_REQUESTS = 50000
+
+    # maximum bytes per Batch API input file, below the 200 MB upload limit
+    BATCH_MAX_BYTES = 190 * 1024 * 1024
+
+    # Batch API polling interval bounds, in seconds
+    BATCH_POLL_INTERVAL = 15
+    BATCH_MAX_POLL_INTERVAL = 300
+
+    # Batch API statuses after which a batch will not progress
+    BATCH_FINAL_STATUSES = ('completed', 'failed', 'expired', 'cancelled')
+
+    # seconds to wait for cancelled batches to settle, up to 10 minutes
+    BATCH_CANCEL_TIMEOUT = 600
+
     def __init__(self, model_name: str):
         '''
         Initialize the OpenAIGPT class.
@@ -66,7 +131,7 @@ class OpenAIGPT(LanguageModel):
 
         # load environment variables
         env_file_path = './config/.env'
-        load_dotenv(env_file_path)
+        _load_env(env_file_path)
 
         # OpenAI client
         self.client = OpenAI()
@@ -75,10 +140,7 @@ class OpenAIGPT(LanguageModel):
         self.model_name = model_name
 
         # OpenAI model token encoding
-        try:
-            self.encoding = tiktoken.encoding_for_model(self.model_name)
-        except Exception as KeyError:
-            self.encoding = tiktoken.get_encoding('o200k_base')
+        self.encoding = _get_encoding(self.model_name)
 
         # log file
         self.log_file = './logs/openai_client.log'
@@ -99,6 +161,9 @@ class OpenAIGPT(LanguageModel):
         '''
         Estimate the number of tokens in a prompt.
 
+        Special token markers are counted as plain text, which skips the
+        special token scan.
+
         :param prompt: The prompt to be estimated.
         :type prompt: str
         
@@ -106,7 +171,34 @@ class OpenAIGPT(LanguageModel):
         :rtype: int
         '''
         # estimate tokens
-        return len(self.encoding.encode(prompt))
+        return len(self.encoding.encode_ordinary(prompt))
+
+    def _estimate_tokens_batch(self, prompts: list) -> list:
+        '''
+        Estimate the number of tokens in many prompts at once.
+
+        Prompts are tokenized in parallel by tiktoken, outside the GIL, in
+        slices of `TOKEN_BATCH_SIZE` prompts; only the counts are kept.
+        Special token markers in the prompts are counted as plain text, so a
+        single narrative cannot fail the whole batch.
+
+        :param prompts: The prompts to be estimated.
+        :type prompts: list
+
+        :return: The estimated number of tokens of each prompt.
+        :rtype: list
+        '''
+        num_threads = os.cpu_count() or 1
+
+        counts = []
+        for start in range(0, len(prompts), self.TOKEN_BATCH_SIZE):
+            tokens = self.encoding.encode_ordinary_batch(
+                prompts[start:start + self.TOKEN_BATCH_SIZE],
+                num_threads=num_threads
+            )
+            counts.extend(len(t) for t in tokens)
+        
+        return counts
     
     def _process_response(self,
                           uuid: str,
@@ -150,38 +242,32 @@ class OpenAIGPT(LanguageModel):
         completion_tokens_used = response.usage.completion_tokens
 
         # update token usage log
-        self.token_usage_log.append(
-            (
-                time.time(),
-                prompt_tokens_used,
-                completion_tokens_used
-            )
+        self._record_token_usage(
+            prompt_tokens_used,
+            completion_tokens_used
         )
 
         # get response
         response_content = response.choices[0].message.content
 
         # parse response
-        response_content = json.loads(response_content)
+        response_content = json_io.loads(response_content)
 
         # add uuid to response
         response_content['uuid'] = uuid
 
-        # get collection
-        collection = self.mongodb_manager.get_collection(
+        # queue response for upload to database, keyed on uuid
+        self.mongodb_manager.enqueue_insert(
+            [response_content],
             db_name=mongo_db_name,
-            collection_name=mongo_collection_name   
-        )
-
-        # upload response to database
-        collection.insert_one(
-            response_content
+            collection_name=mongo_collection_name
         )
     
     def _call_with_backoff(self,
                            request_id: int,
                            uuid: str,
                            message: list[dict],
+                           estimated_tokens: int,
                            mongo_db_name: str = None,
                            mongo_collection_name: str = None,
                            response_format: dict = None,
@@ -199,6 +285,9 @@ class OpenAIGPT(LanguageModel):
         :param message: The message prompt to be processed.
         :type message: list[dict]
 
+        :param estimated_tokens: The estimated tokens in the message prompt.
+        :type estimated_tokens: int
+
         :param mongo_db_name: Name of the MongoDB database (optional).
         :type mongo_db_name: str, optional
 
@@ -219,79 +308,74 @@ class OpenAIGPT(LanguageModel):
         :return: None
         '''
         retry_count = 0
+        last_error = None
         while not self.stop_flag.is_set() and retry_count <= max_retries:
-            with self.semaphore:
-                try:
-                    # get prompts
-                    system_prompt = message[0]['content']
-                    user_prompt = message[1]['content']
-
-                    # estimate tokens
-                    prompt = f'{system_prompt}\n{user_prompt}'
-                    estimated_tokens = self._estimate_tokens(prompt)
-
-                    # update progress bar
-                    self._update_tqdm_description(
-                        pbar,
-                        f'[RUNNING] prompt #{request_id} in thread'
-                    )
-                    
-                    # enforce rate limits
-                    self._enforce_rate_limits(
-                        estimated_tokens,
-                        pbar
-                    )
-
-                    # make request
-                    response = self.client.chat.completions.create(
-                        model=self.model_name,
-                        messages=message,
-                        temperature=self.TEMPERATURE,
-                        response_format=response_format
-                    )
-
-                    self._process_response(
-                        uuid,
-                        system_prompt,
-                        user_prompt,
-                        response,
-                        mongo_db_name,
-                        mongo_collection_name,
-                    )
-
+            try:
+                # get prompts
+                system_prompt = message[0]['content']
+                user_prompt = message[1]['content']
+
+                # enforce rate limits
+                self._enforce_rate_limits(
+                    estimated_tokens,
+                    pbar
+                )
+                if self.stop_flag.is_set():
                     return
-                    
-                except RateLimitError as e_rate_limit:
-                    # update progress bar
-                    self._update_tqdm_description(
-                        pbar,
-                        f'[RETRY {retry_count}] prompt #{request_id} sleeping'
-                    )
-                    
-                    # increment retry count and calculate sleep time
-                    retry_count += 1
-                    random_jitter = random.uniform(0, self.DEFAULT_JITTER)
-                    sleep_time = (2 ** retry_count) + random_jitter
-                    self.stop_flag.wait(sleep_time)
-                
-                except Exception as e:
-                    # handle unexpected errors
-                    self._update_tqdm_description(
-                        pbar,
-                        f'[ERROR] prompt #{request_id} error'
-                    )
-
-                    # capture full traceback
-                    tb_str = traceback.format_exc()
-                    
-                    # write to log file
-                    e_name = e.__class__.__name__
-                    self._log_write(
-                        f'[ERROR] prompt #{uuid} error: {e_name} - {e}\nTraceback:\n{tb_str}'
-                    )
 
-                    return
-        
+                # make request
+                response = self.client.chat.completions.create(
+                    model=self.model_name,
+                    messages=message,
+                    temperature=self.TEMPERATURE,
+                    response_format=response_format
+                )
+
+                self._process_response(
+                    uuid,
+                    system_prompt,
+                    user_prompt,
+                    response,
+                    mongo_db_name,
+                    mongo_collection_name,
+                )
+
+                return
+
+            except RateLimitError as e_rate_limit:
+                last_error = e_rate_limit
+
+                # update progress bar
+                self._update_tqdm_description(
+                    pbar,
+                    f'[RETRY {retry_count}] prompt #{request_id} sleeping'
+                )
+
+                # increment retry count and calculate sleep time
+                retry_count += 1
+                random_jitter = random.uniform(0, self.DEFAULT_JITTER)
+                sleep_time = (2 ** retry_count) + random_jitter
+                self.stop_flag.wait(sleep_time)
+
+            except Exception as e:
+                # handle unexpected errors
+                self._update_tqdm_description(
+                    pbar,
+                    f'[ERROR] prompt #{request_id} error'
+                )
+
+                # write to log file; the traceback is formatted by the
+                # log listener thread
+                self._log_write(
+                    '[ERROR] prompt #%s error: %s - %s',
+                    uuid,
+                    e.__class__.__name__,
+                    e,
+                    exc_info=True
+                )
+
+                return
+
         # exceeded max retries
         if retry_count > max_retries:
             self._update_tqdm_description(
@@ -300,7 +384,11 @@ class OpenAIGPT(LanguageModel):
             )
             
             # write to log file
-            self._log_write(f"[FAILED] prompt #{uuid} exceeded retries - {e_rate_limit}")
+            self._log_write(
+                '[FAILED] prompt #%s exceeded retries - %s',
+                uuid,
+                last_error
+            )
             return
 
     def run_parallel_prompt_tasks(self,
@@ -332,29 +420,447 @@ class OpenAIGPT(LanguageModel):
         '''
         signal.signal(signal.SIGINT, self._signal_handler)
 
+        # send each uuid once, as in batch mode; responses are stored keyed
+        # on uuid, so a repeated uuid would pay for a response that is dropped
+        messages_by_uuid = {}
+        for uuid, message in zip(uuids, messages):
+            messages_by_uuid.setdefault(uuid, message)
+        
+        uuids = list(messages_by_uuid)
+        messages = list(messages_by_uuid.values())
+        del messages_by_uuid
+
         # total tasks
         total_tasks = len(messages)
-        with tqdm(total=total_tasks, desc="Processing requests") as pbar:
-            with ThreadPoolExecutor(max_workers=30) as executor:
-                futures = {
-                    executor.submit(
-                        self._call_with_backoff,
-                        i,
-                        uuid,
-                        message,
-                        mongo_db_name,
-                        mongo_collection_name,
-                        response_format,
-                        pbar
-                    ): i
-                    for i, (uuid, message) in enumerate(zip(uuids, messages))
-                }
-                while futures:
-                    done, _ = wait(futures.keys(), timeout=0.2)
-                    for future in done:
-                        futures.pop(future)
+
+        # estimate tokens for all prompts up front; the system prompt is
+        # shared by all requests, so its count comes from the cache, and
+        # repeated user prompts are tokenized once
+        user_prompts = [message[1]['content'] for message in messages]
+        unique_prompts = list(dict.fromkeys(user_prompts))
+        user_tokens = dict(
+            zip(unique_prompts, self._estimate_tokens_batch(unique_prompts))
+        )
+        estimated_tokens = [
+            self.estimate_tokens(message[0]['content']) + user_tokens[prompt] + 1
+            for message, prompt in zip(messages, user_prompts)
+        ]
+
+        try:
+            # redraw at most twice per second
+            with tqdm(total=total_tasks, desc="Processing requests",
+                      mininterval=0.5, smoothing=0.1) as pbar:
+                # one worker per concurrent request; the pool size bounds
+                # concurrency and _enforce_rate_limits admits each request
+                with ThreadPoolExecutor(max_workers=self.MAX_CONCURRENT_REQUESTS,
+                                        thread_name_prefix='openai') as executor:
+                    futures = [
+                        executor.submit(
+                            self._call_with_backoff,
+                            i,
+                            uuid,
+                            message,
+                            tokens,
+                            mongo_db_name,
+                            mongo_collection_name,
+                            response_format,
+                            pbar
+                        )
+                        for i, (uuid, message, tokens) in enumerate(
+                            zip(uuids, messages, estimated_tokens)
+                        )
+                    ]
+                    for future in as_completed(futures):
                         try:
                             future.result()
                         except Exception as e:
                             pass
                         pbar.update(1)
+        finally:
+            # wait for queued responses to be stored, also on errors
+            for e in self.mongodb_manager.flush():
+                e_name = e.__class__.__name__
+                self._log_write(f'[ERROR] MongoDB write error: {e_name} - {e}')
+
+    def run_batch_prompt_tasks(self,
+                               uuids: list = None,
+                               messages: list = None,
+                               mongo_db_name: str = None,
+                               mongo_collection_name: str = None,
+                               response_format: dict = None) -> None:
+        '''
+        Run multiple prompt tasks through the OpenAI Batch API.
+
+        Prompts are uploaded as JSONL files of at most `BATCH_MAX_REQUESTS`
+        requests and `BATCH_MAX_BYTES` bytes. All batches are created up
+        front and processed asynchronously by OpenAI within 24 hours; the
+        results of each batch are stored in MongoDB once it completes.
+        Batch requests are not subject to the per-minute rate limits.
+
+        :param uuids: List of UUIDs to process.
+        :type uuids: list
+
+        :param messages: List of message prompts to process.
+        :type messages: list
+
+        :param mongo_db_name: Name of the MongoDB database (optional).
+        :type mongo_db_name: str, optional
+
+        :param mongo_collection_name: Name of the MongoDB collection (optional).
+        :type mongo_collection_name: str, optional
+
+        :param response_format: The expected response format (optional).
+        :type response_format: dict, optional
+
+        :return: None
+        '''
+        signal.signal(signal.SIGINT, self._signal_handler)
+
+        # custom ids of the requests sent, mapped to their uuids
+        custom_ids = {}
+
+        try:
+            # create all batches before polling any of them; input files
+            # are built one at a time
+            batches = {}
+            total = 0
+            chunks = self._build_batch_files(
+                uuids,
+                messages,
+                custom_ids,
+                response_format
+            )
+            for lines in chunks:
+                if self.stop_flag.is_set():
+                    break
+
+                batch = self._create_batch(lines)
+                batches[batch.id] = batch
+                total += len(lines)
+            
+            self._poll_batches(
+                batches,
+                total,
+                custom_ids,
+                mongo_db_name,
+                mongo_collection_name
+            )
+        finally:
+            # wait for queued responses to be stored
+            for e in self.mongodb_manager.flush():
+                e_name = e.__class__.__name__
+                self._log_write(f'[ERROR] MongoDB write error: {e_name} - {e}')
+
+    def _build_batch_files(self,
+                           uuids: list,
+                           messages: list,
+                           custom_ids: dict,
+                           response_format: dict = None) -> Iterator[list]:
+        '''
+        Build the JSONL lines of the Batch API input files, one at a time.
+
+        Lines are split into chunks of at most `BATCH_MAX_REQUESTS` lines
+        and `BATCH_MAX_BYTES` bytes. Repeated UUIDs are sent once.
+
+        :param uuids: List of UUIDs to process.
+        :type uuids: list
+
+        :param messages: List of message prompts to process.
+        :type messages: list
+
+        :param custom_ids: Filled with the custom id and UUID of each
+            request as its line is built.
+        :type custom_ids: dict
+
+        :param response_format: The expected response format (optional).
+        :type response_format: dict, optional
+
+        :return: An iterator of chunks, each a list of encoded JSONL lines.
+        :rtype: Iterator[list]
+        '''
+        lines = []
+        size = 0
+        for uuid, message in zip(uuids, messages):
+            custom_id = str(uuid)
+            if custom_id in custom_ids:
+                continue
+
+            custom_ids[custom_id] = uuid
+            body = {
+                'model': self.model_name,
+                'messages': message,
+                'temperature': self.TEMPERATURE
+            }
+            if response_format:
+                body['response_format'] = response_format
+
+            line = json_io.dumps(
+                {
+                    'custom_id': custom_id,
+                    'method': 'POST',
+                    'url': '/v1/chat/completions',
+                    'body': body
+                }
+            )
+
+            # start a new file when this line would exceed either limit;
+            # each line is followed by a newline
+            line_size = len(line) + 1
+            if lines and (len(lines) >= self.BATCH_MAX_REQUESTS
+                          or size + line_size > self.BATCH_MAX_BYTES):
+                yield lines
+                lines = []
+                size = 0
+            
+            lines.append(line)
+            size += line_size
+        
+        if lines:
+            yield lines
+
+    def _create_batch(self, lines: list) -> openai.types.Batch:
+        '''
+        Upload a JSONL input file and create its batch.
+
+        :param lines: The encoded JSONL request lines.
+        :type lines: list
+
+        :return: The created batch.
+        :rtype: openai.types.Batch
+        '''
+        batch_file = self.client.files.create(
+            file=('narrative_blueprint.jsonl', b'\n'.join(lines)),
+            purpose='batch'
+        )
+        batch = self.client.batches.create(
+            input_file_id=batch_file.id,
+            endpoint='/v1/chat/completions',
+            completion_window='24h'
+        )
+        self._log_write(f'[BATCH] {batch.id} created with {len(lines)} prompts')
+
+        return batch
+
+    def _poll_batches(self,
+                      batches: dict,
+                      total: int,
+                      custom_ids: dict,
+                      mongo_db_name: str = None,
+                      mongo_collection_name: str = None) -> None:
+        '''
+        Poll batches until they finish and store their results.
+
+        If stopped by the user, pending batches are cancelled and the
+        results they completed before cancellation are stored.
+
+        :param batches: Batches to poll, keyed by batch id.
+        :type batches: dict
+
+        :param total: Number of requests in all batches.
+        :type total: int
+
+        :param custom_ids: Mapping of request custom ids to UUIDs.
+        :type custom_ids: dict
+
+        :param mongo_db_name: Name of the MongoDB database (optional).
+        :type mongo_db_name: str, optional
+
+        :param mongo_collection_name: Name of the MongoDB collection (optional).
+        :type mongo_collection_name: str, optional
+
+        :return: None
+        '''
+        pending = dict(batches)
+        done = {}
+
+        # poll batch status with backoff
+        poll_interval = self.BATCH_POLL_INTERVAL
+        with tqdm(total=total, desc=f'{self.model_name} - [BATCH]') as pbar:
+            while pending:
+                if self.stop_flag.wait(poll_interval):
+                    break
+
+                poll_interval = min(poll_interval * 2, self.BATCH_MAX_POLL_INTERVAL)
+                self._refresh_batches(
+                    pending,
+                    done,
+                    custom_ids,
+                    mongo_db_name,
+                    mongo_collection_name
+                )
+                
+                # update progress bar
+                finished = 0
+                for batch in chain(pending.values(), done.values()):
+                    counts = batch.request_counts
+                    if counts is not None:
+                        finished += counts.completed + counts.failed
+                pbar.update(finished - pbar.n)
+                pbar.set_postfix({'pending': len(pending)})
+
+        if not pending:
+            return
+        
+        # stopped by user; cancel pending batches and store what they
+        # completed once cancellation settles
+        for batch_id in pending:
+            try:
+                self.client.batches.cancel(batch_id)
+            except openai.APIError as e:
+                # the batch may have finished since the last poll; its
+                # results are still retrieved and stored below
+                e_name = e.__class__.__name__
+                self._log_write(f'[BATCH] {batch_id} cancel error: {e_name} - {e}')
+                continue
+
+            self._log_write(f'[BATCH] {batch_id} cancelled by user')
+        
+        # a second Ctrl+C skips waiting for cancellation to settle
+        skip_wait = threading.Event()
+        signal.signal(signal.SIGINT, lambda sig, frame: skip_wait.set())
+        try:
+            print ('Waiting for cancelled batches to store completed results '
+                   '(press Ctrl+C again to skip)...')
+            deadline = time.monotonic() + self.BATCH_CANCEL_TIMEOUT
+            while pending and time.monotonic() < deadline:
+                if skip_wait.wait(self.BATCH_POLL_INTERVAL):
+                    break
+
+                self._refresh_batches(
+                    pending,
+                    done,
+                    custom_ids,
+                    mongo_db_name,
+                    mongo_collection_name
+                )
+        finally:
+            signal.signal(signal.SIGINT, self._signal_handler)
+        
+        for batch_id in pending:
+            self._log_write(f'[BATCH] {batch_id} not settled, results not stored')
+
+    def _refresh_batches(self,
+                         pending: dict,
+                         done: dict,
+                         custom_ids: dict,
+                         mongo_db_name: str = None,
+                         mongo_collection_name: str = None) -> None:
+        '''
+        Retrieve pending batches and store the results of finished ones.
+
+        Finished batches are moved from `pending` to `done` once their
+        results are stored. API and connection errors are logged and the
+        batch is kept pending, so it is retried on the next poll.
+
+        :param pending: Batches not yet stored, keyed by batch id.
+        :type pending: dict
+
+        :param done: Batches already stored, keyed by batch id.
+        :type done: dict
+
+        :param custom_ids: Mapping of request custom ids to UUIDs.
+        :type custom_ids: dict
+
+        :param mongo_db_name: Name of the MongoDB database (optional).
+        :type mongo_db_name: str, optional
+
+        :param mongo_collection_name: Name of the MongoDB collection (optional).
+        :type mongo_collection_name: str, optional
+
+        :return: None
+        '''
+        for batch_id in list(pending):
+            try:
+                batch = self.client.batches.retrieve(batch_id)
+                pending[batch_id] = batch
+                if batch.status not in self.BATCH_FINAL_STATUSES:
+                    continue
+
+                self._store_batch_results(
+                    batch,
+                    custom_ids,
+                    mongo_db_name,
+                    mongo_collection_name
+                )
+            except openai.APIError as e:
+                e_name = e.__class__.__name__
+                self._log_write(f'[BATCH] {batch_id} poll error: {e_name} - {e}')
+                continue
+
+            del pending[batch_id]
+            done[batch_id] = batch
+
+    def _store_batch_results(self,
+                             batch: openai.types.Batch,
+                             custom_ids: dict,
+                             mongo_db_name: str = None,
+                             mongo_collection_name: str = None) -> None:
+        '''
+        Store the results of a finished batch.
+
+        :param batch: The finished batch.
+        :type batch: openai.types.Batch
+
+        :param custom_ids: Mapping of request custom ids to UUIDs.
+        :type custom_ids: dict
+
+        :param mongo_db_name: Name of the MongoDB database (optional).
+        :type mongo_db_name: str, optional
+
+        :param mongo_collection_name: Name of the MongoDB collection (optional).
+        :type mongo_collection_name: str, optional
+
+        :return: None
+        '''
+        self._log_write(f'[BATCH] {batch.id} finished with status {batch.status}')
+
+        # batch level errors, e.g. input file validation failures
+        if batch.errors and batch.errors.data:
+            for error in batch.errors.data:
+                line = f' (line {error.line})' if error.line is not None else ''
+                self._log_write(
+                    f'[BATCH] {batch.id} error: {error.code} - {error.message}{line}'
+                )
+
+        if batch.error_file_id:
+            self._log_write(
+                f'[BATCH] {batch.id} failed requests in file {batch.error_file_id}'
+            )
+
+        if not batch.output_file_id:
+            return
+        
+        # store results
+        output = self.client.files.content(batch.output_file_id).text
+        for line in output.splitlines():
+            if not line:
+                continue
+
+            result = json_io.loads(line)
+            custom_id = result['custom_id']
+            response = result.get('response') or {}
+            if response.get('status_code') != 200:
+                # HTTP errors carry their reason in the response body
+                error = (response.get('body') or {}).get('error') or result.get('error')
+                self._log_write(
+                    f"[ERROR] prompt #{custom_id} batch error: "
+                    f"{response.get('status_code')} - {error}"
+                )
+                continue
+
+            try:
+                # parse response
+                content = response['body']['choices'][0]['message']['content']
+                response_content = json_io.loads(content)
+            except Exception as e:
+                e_name = e.__class__.__name__
+                self._log_write(f'[ERROR] prompt #{custom_id} error: {e_name} - {e}')
+                continue
+
+            # add uuid to response and queue it for upload to database
+            response_content['uuid'] = custom_ids[custom_id]
+            self.mongodb_manager.enqueue_insert(
+                [response_content],
+                db_name=mongo_db_name,
+                collection_name=mongo_collection_name
+            )
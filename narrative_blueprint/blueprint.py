@@ -2,17 +2,31 @@
 
 # import modules
 import os
-import json
-import tomli
+import gc
 import string
 import pandas as pd
 
+# streaming JSON parser, optional
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+# TOML loader
+from utils.toml_cache import read_toml
+
+# JSON helpers
+from utils import json_io
+
 # import LLM base class
 from models import LanguageModel
 
 # MongoDB connection
 from databases import MongoDBManager
 
+# structured output schema
+from .schemas import blueprint_response_format
+
 # MongoDB errors
 from pymongo.errors import ConnectionFailure
 
@@ -21,6 +35,10 @@ class NarrativeBlueprint:
     '''
     Narrative blueprint class
     '''
+
+    # columns required in the narratives dataset
+    REQUIRED_COLUMNS = ['uuid', 'narrative']
+
     def __init__(self, llm_engine: LanguageModel, args: dict = None):
         '''
         Initialize the Narrative Blueprint engine.
@@ -67,9 +85,8 @@ class NarrativeBlueprint:
         self.narratives = self._load_narratives(narrative_path)
 
         # check required columns in narratives dataset
-        required_columns = ['uuid', 'narrative']
         missing_columns = [
-            col for col in required_columns
+            col for col in self.REQUIRED_COLUMNS
             if col not in self.narratives.columns
         ]
         if missing_columns:
@@ -80,52 +97,58 @@ class NarrativeBlueprint:
         # sample size from args
         self.sample_size = self.args.get('sample_size', None)
 
-    def _load_system_prompt(self, template_path: str) -> str:
-        '''
-        Load the system prompt from a template file.
+        # load prompt template
+        template_path = self.args.get('prompt_template')
+        if not template_path:
+            raise ValueError('The `prompt_template` argument is required')
+        
+        self._system_prompt, self._message_prompt_parts = self._load_template(
+            template_path
+        )
 
-        :param template_path: The path to the TOML template file.
-        :type template_path: str
+        # response format, built once
+        if self.args.get('structured_output'):
+            self._response_format = blueprint_response_format()
+        else:
+            self._response_format = {'type': 'json_object'}
 
-        :return: The system prompt.
-        :rtype: str
-        '''
-        # load prompts
-        with open(template_path, 'rb') as file:
-            prompts = tomli.load(file)
-        
-        # get the system prompt
-        return prompts.get('system')['prompt']
-    
-    def _load_message_prompt(self, template_path: str, narrative: str = None) -> str:
+    def _load_template(self, template_path: str) -> tuple:
         '''
-        Load the message prompt from a template file.
+        Load the system and message prompts from a template file.
+
+        The message prompt is split around its `${narrative}` placeholder
+        once, so each narrative is substituted with a single string join.
 
         :param template_path: The path to the TOML template file.
         :type template_path: str
 
-        :param narrative: The narrative to be used in the message prompt.
-        :type narrative: str
+        :return: A tuple of the system prompt and the message prompt parts.
+        :rtype: tuple
 
-        :return: The message prompt.
-        :rtype: str
+        :raises KeyError: If the message prompt has placeholders other
+            than `narrative`.
         '''
         # load prompts
-        with open(template_path, 'rb') as file:
-            prompts = tomli.load(file)
-        
-        # get the message prompt
+        prompts = read_toml(template_path)
+        system_prompt = prompts.get('system')['prompt']
         message_prompt = prompts.get('message')['prompt']
 
-        # substitute the narrative into the message prompt
-        return string.Template(message_prompt).substitute(
-            narrative=narrative
+        # substitute a marker once to validate the template and find the
+        # placeholder positions
+        marker = '\x00narrative\x00'
+        message_prompt = string.Template(message_prompt).substitute(
+            narrative=marker
         )
+
+        return system_prompt, message_prompt.split(marker)
     
     def _load_narratives(self, path: str = None) -> pd.DataFrame:
         '''
         Load the narratives from a CSV, XLSX, or JSON file.
 
+        Only the required columns are kept. JSON arrays are streamed record
+        by record when `ijson` is installed.
+
         :param path: The path to the file containing the narratives.
             Supported formats: CSV, XLSX, JSON
         :type path: str
@@ -137,23 +160,41 @@ class NarrativeBlueprint:
             # get file extension
             file_extension = os.path.splitext(path)[1].lower()
             
+            # read only the required columns
+            usecols = lambda col: col in self.REQUIRED_COLUMNS
+
             if file_extension == '.csv':
-                return pd.read_csv(path, encoding='utf-8', low_memory=False)
+                return pd.read_csv(
+                    path,
+                    encoding='utf-8',
+                    usecols=usecols,
+                    low_memory=False
+                )
             
             elif file_extension in ['.xlsx', '.xls']:
-                return pd.read_excel(path)
+                return pd.read_excel(path, usecols=usecols)
             
             elif file_extension == '.json':
-                with open(path, 'r', encoding='utf-8') as file:
-                    data = json.load(file)
+                with open(path, 'rb') as file:
+                    if ijson is not None and self._first_json_char(file) == b'[':
+                        # e.g., [{'uuid': '...', 'narrative': '...'}, ...]
+                        records = ijson.items(file, 'item', use_float=True)
+                        return pd.DataFrame.from_records(
+                            self._select_required_keys(record)
+                            for record in records
+                        )
+                    
+                    data = json_io.load(file)
                 
                 # handle different JSON structures
                 if isinstance(data, list):
                     # e.g., [{'uuid': '...', 'narrative': '...'}, ...]
-                    return pd.DataFrame(data)
+                    return pd.DataFrame.from_records(
+                        self._select_required_keys(record) for record in data
+                    )
                 elif isinstance(data, dict):
                     # e.g., {'uuid': '...', 'narrative': '...'}
-                    return pd.DataFrame([data])
+                    return pd.DataFrame([self._select_required_keys(data)])
                 else:
                     raise ValueError(f'Unsupported JSON structure in {path}')
             
@@ -165,6 +206,37 @@ class NarrativeBlueprint:
         except Exception as e:
             raise ValueError(f'Error loading narratives from {path}: {str(e)}')
     
+    def _first_json_char(self, file) -> bytes:
+        '''
+        Get the first non-whitespace byte of a JSON file, then rewind it.
+
+        :param file: A JSON file opened in binary mode.
+        :type file: io.BufferedReader
+
+        :return: The first non-whitespace byte, or b'' if there is none.
+        :rtype: bytes
+        '''
+        char = file.read(1)
+        while char and char.isspace():
+            char = file.read(1)
+        
+        file.seek(0)
+        return char
+
+    def _select_required_keys(self, record: dict) -> dict:
+        '''
+        Keep only the required columns of a narrative record.
+
+        :param record: A narrative record.
+        :type record: dict
+
+        :return: The record restricted to the required columns it has.
+        :rtype: dict
+        '''
+        return {
+            key: record[key] for key in self.REQUIRED_COLUMNS if key in record
+        }
+    
     def _load_uuids_from_collection(self) -> list:
         '''
         Load the uuids from a MongoDB collection.
@@ -179,29 +251,47 @@ class NarrativeBlueprint:
         Prepare the messages for the LLM.
 
         Each message is a list of role-based dictionaries containing the system
-        prompt and the narrative-specific user prompt.
+        prompt and the narrative-specific user prompt. The narratives dataset
+        is released once the messages are built.
 
         :return: A tuple of uuids and messages lists ready for LLM input.
         :rtype: tuple
         '''
-        template_path = self.args.get('prompt_template')
-        system_prompt = self._load_system_prompt(template_path)
+        message_prompt_parts = self._message_prompt_parts
+
+        # system message shared by all messages; it is only read downstream
+        system_message = {'role': 'system', 'content': self._system_prompt}
 
-        # filter narratives by uuids
-        uuids = self._load_uuids_from_collection()
-        self.narratives = self.narratives[~ self.narratives['uuid'].isin(uuids)].copy()
+        # filter out narratives whose uuids are already collected
+        collected_uuids = set(self._load_uuids_from_collection())
+        mask = ~ self.narratives['uuid'].isin(collected_uuids)
+        uuids = self.narratives.loc[mask, 'uuid'].tolist()
+        narratives = self.narratives.loc[mask, 'narrative'].to_numpy()
 
-        # prepare messages for each narrative
+        # prepare messages for each narrative; repeated narratives share a
+        # single message, which is only read downstream
+        messages_by_narrative = {}
         messages_list = []
-        for narrative in self.narratives['narrative']:
-            user_prompt = self._load_message_prompt(template_path, narrative=narrative)
-            message = [
-                {'role': 'system', 'content': system_prompt},
-                {'role': 'user', 'content': user_prompt}
-            ]
+        for narrative in narratives:
+            narrative = str(narrative)
+            message = messages_by_narrative.get(narrative)
+            if message is None:
+                user_prompt = narrative.join(message_prompt_parts)
+                message = [
+                    system_message,
+                    {'role': 'user', 'content': user_prompt}
+                ]
+                messages_by_narrative[narrative] = message
+            
             messages_list.append(message)
         
-        return self.narratives['uuid'].tolist(), messages_list
+        # the dataset is no longer needed; release it before the requests
+        # start allocating
+        del narratives, messages_by_narrative
+        self.narratives = None
+        gc.collect()
+
+        return uuids, messages_list
     
     def run_blueprint_analysis(self) -> None:
         '''
@@ -227,6 +317,12 @@ class NarrativeBlueprint:
         print('MongoDB access to database successful')
         print ('')
 
+        # index uuids, used to skip narratives already processed
+        self.mongodb_manager.ensure_indexes(
+            self.mongo_db_name,
+            self.mongo_collection_name
+        )
+
         # compose messages
         uuids, messages_list = self._compose_blueprint_messages()
 
@@ -235,12 +331,18 @@ class NarrativeBlueprint:
             uuids = uuids[:self.sample_size]
             messages_list = messages_list[:self.sample_size]
 
-        # run parallel prompt tasks
-        print('Running narrative blueprint analysis...')
-        self.llm_engine.run_parallel_prompt_tasks(
+        # run prompt tasks, in parallel or through the batch API
+        if self.args.get('batch'):
+            print('Running narrative blueprint analysis in batch mode...')
+            run_prompt_tasks = self.llm_engine.run_batch_prompt_tasks
+        else:
+            print('Running narrative blueprint analysis...')
+            run_prompt_tasks = self.llm_engine.run_parallel_prompt_tasks
+
+        run_prompt_tasks(
             uuids=uuids,
             messages=messages_list,
             mongo_db_name=self.mongo_db_name,
             mongo_collection_name=self.mongo_collection_name,
-            response_format={'type': 'json_object'}
+            response_format=self._response_format
         )
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+
+'''
+Defines the structured output schema of the narrative blueprint
+
+The schema matches the JSON format requested by the templates in
+`prompt_examples/`. Custom templates with a different output structure
+should not enable structured outputs.
+
+'''
+
+# typing
+from typing import List
+
+# pydantic
+from pydantic import BaseModel, ConfigDict
+
+# content topics
+class ContentTopics(BaseModel):
+    '''
+    Topics evident in the narrative, flagged as 1 or 0.
+    '''
+    model_config = ConfigDict(extra='forbid')
+
+    government: int
+    military: int
+    elections: int
+    non_state_political_actor: int
+    business: int
+    influential_individuals: int
+    political_party: int
+    racial_ethnic_religious_sexual_identity_group: int
+    national_security: int
+    terrorism: int
+    crime: int
+    cybersecurity: int
+    immigration: int
+    economic_issue: int
+    health: int
+    environment: int
+    conspiracy: int
+    neutral: int
+    other: str
+
+# blueprint result
+class BlueprintResult(BaseModel):
+    '''
+    Narrative blueprint analysis of a single narrative.
+    '''
+    model_config = ConfigDict(extra='forbid')
+
+    content_topics: ContentTopics
+    disinformation_tactic: List[str]
+    target_audience: List[str]
+    intent: str
+    calls_to_action: List[str]
+    key_actors_entities: List[str]
+    key_claims: List[str]
+
+def blueprint_response_format() -> dict:
+    '''
+    Build the strict structured output response format for the blueprint.
+
+    :return: An OpenAI `json_schema` response format.
+    :rtype: dict
+    '''
+    return {
+        'type': 'json_schema',
+        'json_schema': {
+            'name': 'narrative_blueprint',
+            'strict': True,
+            'schema': BlueprintResult.model_json_schema()
+        }
+    }
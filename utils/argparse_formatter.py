@@ -19,18 +19,21 @@ class CustomHelpFormatter(RawDescriptionHelpFormatter):
     
     def _format_action(self, action):
         if isinstance(action, _SubParsersAction):
-            # get the subaction help strings
-            subactions = list(action._get_subactions())
+            # reuse the block formatted by a previous call
+            cached = getattr(action, '_cached_subcmd_block', None)
+            if cached is not None:
+                return cached
 
             # format the help for each subcommand
-            parts = []
-            for subaction in subactions:
-                # build the complete help string with proper formatting
-                cmd = f"  {subaction.metavar or subaction.dest:<20} {subaction.help or ''}"
-                parts.append(cmd)
+            parts = [
+                f"  {subaction.metavar or subaction.dest:<20} {subaction.help or ''}"
+                for subaction in action._get_subactions()
+            ]
             
             # join all parts with newlines
-            return "\n".join(parts)
+            block = "\n".join(parts)
+            action._cached_subcmd_block = block
+            return block
         return super()._format_action(action)
 
     def _split_lines(self, text, width):
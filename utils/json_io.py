@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+
+'''
+JSON helpers backed by orjson, with a fallback to the stdlib json module
+
+'''
+
+try:
+    import orjson as _json
+except ImportError:
+    _json = None
+    import json
+
+def loads(data):
+    '''
+    Deserialize a JSON document.
+
+    :param data: The JSON document.
+    :type data: str | bytes
+
+    :return: The deserialized object.
+    '''
+    if _json is not None:
+        return _json.loads(data)
+
+    return json.loads(data)
+
+def load(file):
+    '''
+    Deserialize a JSON document from a file object.
+
+    :param file: A file object opened for reading.
+    :type file: io.IOBase
+
+    :return: The deserialized object.
+    '''
+    return loads(file.read())
+
+def dumps(obj) -> bytes:
+    '''
+    Serialize an object to UTF-8 encoded JSON.
+
+    :param obj: The object to serialize.
+
+    :return: The JSON document.
+    :rtype: bytes
+    '''
+    if _json is not None:
+        return _json.dumps(obj)
+
+    return json.dumps(obj, ensure_ascii=False).encode('utf-8')
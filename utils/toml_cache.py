@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+
+# import modules
+import os
+
+# cache
+from functools import lru_cache
+
+# TOML parser: rtoml if installed, else stdlib tomllib on Python 3.11+,
+# else tomli
+try:
+    import rtoml as _toml
+except ImportError:
+    try:
+        import tomllib as _toml
+    except ImportError:
+        import tomli as _toml
+
+@lru_cache(maxsize=16)
+def load_toml(path: str, mtime: float) -> dict:
+    '''
+    Load and parse a TOML file, caching the result.
+
+    The modification time is part of the cache key, so an edited file is
+    parsed again. The returned dictionary is shared between callers and
+    must not be modified.
+
+    :param path: The path to the TOML file.
+    :type path: str
+
+    :param mtime: The modification time of the file.
+    :type mtime: float
+
+    :return: The parsed TOML document.
+    :rtype: dict
+    '''
+    with open(path, 'r', encoding='utf-8') as file:
+        return _toml.loads(file.read())
+
+def read_toml(path: str) -> dict:
+    '''
+    Load a TOML file through the `load_toml` cache.
+
+    :param path: The path to the TOML file.
+    :type path: str
+
+    :return: The parsed TOML document.
+    :rtype: dict
+    '''
+    return load_toml(path, os.path.getmtime(path))